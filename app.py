@@ -1,10 +1,91 @@
+import atexit
+import gzip
+import hashlib
+import logging
 import os
-import uuid # Para gerar nomes de arquivo únicos
+import re
+import secrets # Para gerar nomes de arquivo únicos
+import shutil
+import stat
+import struct
+import tempfile
+import threading
+import time
 import zipfile # Para criar arquivos ZIP
-from flask import Flask, request, send_file, render_template_string, redirect, url_for, flash, g 
-import pandas as pd
-import pdfplumber
-from collections import defaultdict
+import zlib
+from collections import OrderedDict
+from importlib.util import find_spec
+from io import BytesIO
+from logging.handlers import WatchedFileHandler
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from flask import Flask, Request, Response, request, send_file, redirect, url_for, flash, g, session
+import numpy as np
+from array import array
+# pandas, pdfplumber e pyarrow são importados sob demanda, dentro dos métodos que os usam:
+# somam centenas de milissegundos à inicialização de cada worker e o formulário (GET) não precisa deles.
+
+try:
+    import brotli
+except ImportError: # Brotli é opcional: sem ela, o formulário é servido só com gzip
+    brotli = None
+
+# xlsxwriter é opcional: sem ela, as planilhas são gravadas pelo openpyxl (mais lento e com mais memória)
+XLSXWRITER_DISPONIVEL = find_spec('xlsxwriter') is not None
+
+# --- Funções auxiliares compiladas ---
+def _intervalos_fusao_titulos(qtd_valida, tem_titulo, y_linha, y_tolerancia):
+    """
+    Calcula quais linhas candidatas formam cada item da tabela, juntando títulos de múltiplas linhas.
+
+    Uma linha com QTD válido inicia um item; as linhas seguintes são fundidas a ele enquanto
+    não tiverem QTD válido, tiverem título e estiverem a menos de y_tolerancia da última linha fundida.
+    Linhas sem QTD válido que não foram fundidas são descartadas.
+
+    :param qtd_valida: np.ndarray (bool), se o QTD de cada linha é numérico.
+    :param tem_titulo: np.ndarray (bool), se cada linha tem texto na coluna TITULO.
+    :param y_linha: np.ndarray (float32), nível Y de cada linha (ordenado de cima para baixo).
+    :param y_tolerancia: float, distância vertical máxima entre linhas de um mesmo item.
+    :return: np.ndarray (int32, n x 2), intervalos [inicio, fim) de linhas que formam cada item.
+    """
+    n_linhas = qtd_valida.shape[0]
+    intervalos = np.empty((n_linhas, 2), dtype=np.int32)
+    n_itens = 0
+    i = 0
+    while i < n_linhas:
+        if not qtd_valida[i]:
+            i += 1 # Linha sem QTD válido e que não faz parte de uma fusão: descartada
+            continue
+        y_atual = y_linha[i]
+        j = i + 1
+        while j < n_linhas and not qtd_valida[j] and tem_titulo[j] and (y_linha[j] - y_atual) < y_tolerancia:
+            y_atual = y_linha[j] # A comparação seguinte é feita com a última linha fundida
+            j += 1
+        intervalos[n_itens, 0] = i
+        intervalos[n_itens, 1] = j
+        n_itens += 1
+        i = j # Pula para a próxima linha após as que foram fundidas
+    return intervalos[:n_itens]
+
+_INTERVALOS_FUSAO_COMPILADA = None # _intervalos_fusao_titulos compilada, criada por _obter_intervalos_fusao_titulos
+
+def _obter_intervalos_fusao_titulos():
+    """
+    Devolve _intervalos_fusao_titulos compilada pelo Numba, importando-o só na primeira chamada:
+    a importação do Numba custa cerca de 200 ms e não é necessária para servir o formulário.
+    Sem o Numba (opcional), devolve a própria função em Python puro.
+
+    :return: função com a mesma assinatura de _intervalos_fusao_titulos.
+    """
+    global _INTERVALOS_FUSAO_COMPILADA
+    if _INTERVALOS_FUSAO_COMPILADA is None:
+        try:
+            from numba import njit
+        except ImportError:
+            _INTERVALOS_FUSAO_COMPILADA = _intervalos_fusao_titulos
+        else:
+            _INTERVALOS_FUSAO_COMPILADA = njit(cache=True)(_intervalos_fusao_titulos)
+    return _INTERVALOS_FUSAO_COMPILADA
 
 # --- Classe ExtratorTabelaPDF ---
 class ExtratorTabelaPDF:
@@ -19,6 +100,26 @@ class ExtratorTabelaPDF:
     # Cabeçalhos usados como âncoras para definir limites de coluna
     COL_OPERACOES = "OPERAÇÕES"
     COL_FORNECIMENTO = "FORNECIMENTO"
+    # Ordem dos cabeçalhos-âncora; o índice de cada um é o código gravado em tipos_cabecalho
+    HEADER_KEYS = (COL_OPERACOES, COL_QTD, COL_CODIGO, COL_TITULO, COL_FORNECIMENTO)
+    # Variantes de texto para cada cabeçalho que procuramos
+    HEADER_VARIANTS = {
+        COL_OPERACOES: [COL_OPERACOES, "OPERACÕES", "OPERACOES"],
+        COL_QTD: [COL_QTD, "QTD."],
+        COL_CODIGO: [COL_CODIGO, "CODIGO", "CÓD.", "COD."],
+        COL_TITULO: [COL_TITULO, "TÍTULO", "DESCRIÇÃO", "DESCRICAO", "TITULO"],
+        COL_FORNECIMENTO: [COL_FORNECIMENTO] # Usado para delimitar o fim da coluna TITULO
+    }
+    # Máscara de bits com todos os cabeçalhos de HEADER_KEYS presentes (bit i <-> HEADER_KEYS[i])
+    HEADERS_ESSENCIAIS_MASK = (1 << len(HEADER_KEYS)) - 1
+    # Colunas de dados, da esquerda para a direita; o índice de cada uma é o código devolvido por _atribuir_colunas
+    DATA_COLUMNS = (COL_QTD, COL_CODIGO, COL_TITULO)
+    # Âncora da linha de resumo que encerra a tabela de itens ("Troca / R&I", "TROCA/R&I", ...), em maiúsculas
+    SUMMARY_ANCHOR_RE = re.compile(r"TROCA\s*/\s*R&I")
+    # Tabela de tradução do separador decimal usada ao limpar a QTD ("1,00" -> "1.00")
+    QTD_DECIMAL_TABLE = str.maketrans({",": "."})
+    # Formatos aceitos por salvar_resultado_excel
+    FORMATOS_SAIDA = ("xlsx", "parquet")
 
     def __init__(self, debug=False, debug_image=False, base_path="."):
         """
@@ -32,13 +133,18 @@ class ExtratorTabelaPDF:
         self.debug = debug
         self.debug_image = debug_image
         self.base_path = base_path 
+        # Tabela de busca dos cabeçalhos, montada uma única vez: variante em maiúsculas -> índice em HEADER_KEYS
+        self._header_lookup = {variant.upper(): key_idx for key_idx, key in enumerate(self.HEADER_KEYS)
+                               for variant in self.HEADER_VARIANTS[key]}
+        # Comprimentos possíveis de um cabeçalho; palavras ASCII de outro comprimento nem passam por upper()
+        self._header_lengths = frozenset(len(variant) for variant in self._header_lookup)
 
     def _print_debug(self, message):
         """Imprime mensagens de depuração se self.debug for True."""
         if self.debug:
             print(message)
 
-    def _encontrar_limites_colunas_cabecalho(self, page_words, page_width_param, page_height_param):
+    def _encontrar_limites_colunas_cabecalho(self, page_words, tipos_cabecalho, page_width_param, page_height_param):
         """
         Analisa as palavras extraídas de uma página PDF para encontrar os cabeçalhos
         das colunas de interesse e estimar seus limites horizontais (coordenadas x).
@@ -48,6 +154,8 @@ class ExtratorTabelaPDF:
 
         :param page_words: list, lista de dicionários, onde cada dicionário representa uma palavra
                            extraída da página com suas propriedades (texto, x0, x1, top, bottom).
+        :param tipos_cabecalho: np.ndarray (int8), para cada palavra, o índice em HEADER_KEYS do
+                                cabeçalho que ela representa, ou -1 se não for um cabeçalho.
         :param page_width_param: float, largura total da página PDF.
         :param page_height_param: float, altura total da página PDF.
         :return: tuple (found_headers_info, header_y_bottom_overall, column_boundaries)
@@ -60,59 +168,38 @@ class ExtratorTabelaPDF:
         header_y_top_overall = page_height_param 
         header_y_bottom_overall = 0
 
-        # Variantes de texto para cada cabeçalho que procuramos
-        header_variants = {
-            self.COL_OPERACOES: [self.COL_OPERACOES, "OPERACÕES", "OPERACOES"],
-            self.COL_QTD: [self.COL_QTD, "QTD."],
-            self.COL_CODIGO: [self.COL_CODIGO, "CODIGO", "CÓD.", "COD."],
-            self.COL_TITULO: [self.COL_TITULO, "TÍTULO", "DESCRIÇÃO", "DESCRICAO", "TITULO"],
-            self.COL_FORNECIMENTO: [self.COL_FORNECIMENTO] # Usado para delimitar o fim da coluna TITULO
-        }
-        
-        possible_headers = defaultdict(list) # Armazena todas as palavras que correspondem a variantes de cabeçalho
-        for word in page_words:
-            current_word_text = word["text"].strip().upper() if word["text"] else ""
-            for header_key, variants in header_variants.items():
-                if current_word_text in [v.upper() for v in variants]:
-                    possible_headers[header_key].append(word)
-                    break # Palavra correspondeu a um tipo de cabeçalho, vai para a próxima palavra
-
-        # Cabeçalhos essenciais para definir os limites das colunas de interesse
-        essential_headers_for_boundaries = [self.COL_OPERACOES, self.COL_QTD, self.COL_CODIGO, self.COL_TITULO, self.COL_FORNECIMENTO]
-        if not all(key in possible_headers for key in essential_headers_for_boundaries):
-            self._print_debug(f"[DEBUG] Nem todos os cabeçalhos essenciais para limites ({essential_headers_for_boundaries}) foram encontrados.")
-            self._print_debug(f"[DEBUG] Cabeçalhos encontrados por tipo: { {k: len(v) for k, v in possible_headers.items()} }")
-            return None, 0, {}
+        candidate_idx = np.flatnonzero(tipos_cabecalho >= 0) # Só visita as palavras já classificadas como cabeçalho
+        candidate_kinds = tipos_cabecalho[candidate_idx]
+
+        # Cabeçalhos essenciais para definir os limites das colunas de interesse (todos os de HEADER_KEYS).
+        # A presença de todos já foi verificada por _extrair_dados_baseado_em_texto antes de chegar aqui.
+        essential_headers_for_boundaries = self.HEADER_KEYS
 
         # Tenta encontrar a linha de cabeçalho mais coesa (palavras alinhadas verticalmente)
-        # Usa o 'top' do primeiro cabeçalho essencial encontrado (na ordem definida) como referência vertical
-        ref_y_top = 0
-        for h_key in essential_headers_for_boundaries: 
-            if possible_headers.get(h_key): # Se encontrou alguma palavra para este tipo de cabeçalho
-                ref_y_top = min(w["top"] for w in possible_headers[h_key]) # Pega o 'top' mais alto entre elas
-                self._print_debug(f"[DEBUG] Usando '{h_key}' (top: {ref_y_top}) como referência Y para a linha do cabeçalho.")
-                break # Achou a referência, para
-        if ref_y_top == 0: # Se nenhum dos cabeçalhos essenciais foi encontrado
-            self._print_debug(f"[DEBUG] Nenhum cabeçalho essencial encontrado para ancorar a linha Y.")
-            return None, 0, {}
+        # Usa o 'top' mais alto do primeiro cabeçalho essencial (OPERAÇÕES) como referência vertical
+        ref_key = essential_headers_for_boundaries[0]
+        ref_y_top = min(page_words[idx]["top"] for idx in candidate_idx[candidate_kinds == 0].tolist())
+        self._print_debug(f"[DEBUG] Usando '{ref_key}' (top: {ref_y_top}) como referência Y para a linha do cabeçalho.")
 
         y_coord_tolerance = 5 # Palavras dentro desta tolerância vertical são consideradas na mesma linha de cabeçalho
 
-        # Seleciona a melhor palavra (mais à esquerda e alinhada) para cada tipo de cabeçalho essencial
-        for header_key in essential_headers_for_boundaries:
-            best_word_for_header = None
-            # Filtra as palavras candidatas para este header_key que estão alinhadas com ref_y_top
-            aligned_candidates = [w for w in possible_headers.get(header_key, []) if abs(w["top"] - ref_y_top) < y_coord_tolerance]
-            if aligned_candidates:
-                best_word_for_header = min(aligned_candidates, key=lambda w: w["x0"]) # Pega a mais à esquerda
-                found_headers_info[header_key] = {"word": best_word_for_header, 
-                                                  "center_x": (best_word_for_header["x0"] + best_word_for_header["x1"]) / 2}
-                header_y_top_overall = min(header_y_top_overall, best_word_for_header["top"])
-                header_y_bottom_overall = max(header_y_bottom_overall, best_word_for_header["bottom"])
-            else:
+        # Seleciona, numa única passada, a melhor palavra (mais à esquerda e alinhada com ref_y_top)
+        # para cada tipo de cabeçalho essencial
+        best_words = [None] * len(essential_headers_for_boundaries)
+        for idx, kind in zip(candidate_idx.tolist(), candidate_kinds.tolist()):
+            word = page_words[idx]
+            if abs(word["top"] - ref_y_top) < y_coord_tolerance and (best_words[kind] is None or word["x0"] < best_words[kind]["x0"]):
+                best_words[kind] = word
+
+        for header_key, best_word_for_header in zip(essential_headers_for_boundaries, best_words):
+            if best_word_for_header is None:
                 # Se um cabeçalho essencial para definir os limites não for encontrado alinhado, é um problema.
                 self._print_debug(f"[DEBUG] Cabeçalho essencial '{header_key}' não encontrado alinhado com ref_y_top={ref_y_top}. Falha na definição de limites.")
                 return None, 0, {}
+            found_headers_info[header_key] = {"word": best_word_for_header, 
+                                              "center_x": (best_word_for_header["x0"] + best_word_for_header["x1"]) / 2}
+            header_y_top_overall = min(header_y_top_overall, best_word_for_header["top"])
+            header_y_bottom_overall = max(header_y_bottom_overall, best_word_for_header["bottom"])
 
         # Define os limites das colunas (x0, x1) com base nas posições das palavras de cabeçalho encontradas
         column_boundaries = {}
@@ -147,48 +234,106 @@ class ExtratorTabelaPDF:
         
         return found_headers_info, header_y_bottom_overall, column_boundaries
 
+    def _atribuir_colunas(self, x0, x1, column_xbounds):
+        """
+        Atribui cada palavra a uma das colunas de dados (QTD, CÓDIGO, TITULO) de forma vetorizada.
+
+        Uma palavra encaixa numa coluna se o seu centro estiver dentro da faixa da coluna ou se houver
+        sobreposição significativa (>40% da largura da palavra ou >5 pixels absolutos). Havendo
+        ambiguidade, QTD e CÓDIGO têm prioridade sobre TITULO, que é mais flexível.
+
+        :param x0: np.ndarray, coordenada x inicial de cada palavra.
+        :param x1: np.ndarray, coordenada x final de cada palavra.
+        :param column_xbounds: dict, limites de coluna devolvidos por _encontrar_limites_colunas_cabecalho.
+        :return: np.ndarray (int8), índice em DATA_COLUMNS da coluna de cada palavra, ou -1 se nenhuma.
+        """
+        bounds = np.array([column_xbounds[col][:2] for col in self.DATA_COLUMNS], dtype=np.float32)
+
+        # Centro dentro da coluna: uma única busca binária sobre [qtd_x0, qtd_x1, cod_x0, cod_x1, tit_x0, tit_x1].
+        # O máximo acumulado mantém as bordas ordenadas caso faixas vizinhas se sobreponham,
+        # cedendo a região comum à coluna mais à esquerda (a mesma prioridade da regra de encaixe).
+        edges = np.maximum.accumulate(bounds.ravel())
+        col_of_bin = np.array([-1, 0, -1, 1, -1, 2, -1], dtype=np.int8)
+        center_col = col_of_bin[np.searchsorted(edges, (x0 + x1) * 0.5, side="right")]
+
+        # Sobreposição significativa, calculada para as três colunas ao mesmo tempo
+        word_width = (x1 - x0)[:, None]
+        overlap_width = np.minimum(x1[:, None], bounds[:, 1]) - np.maximum(x0[:, None], bounds[:, 0])
+        fits = ((word_width > 0) & (overlap_width > 0.4 * word_width)) | (overlap_width > 5)
+        fits |= center_col[:, None] == np.arange(len(self.DATA_COLUMNS))
+
+        # Prioriza colunas mais à esquerda se houver ambiguidade de encaixe
+        return np.select([fits[:, 0], fits[:, 1], fits[:, 2]], [0, 1, 2], default=-1).astype(np.int8)
+
     def _extrair_dados_baseado_em_texto(self, page):
         """
         Extrai os dados da tabela da página fornecida, usando uma abordagem baseada
         na análise de texto e coordenadas. Este é o método principal de extração.
 
-        :param page: objeto Page do pdfplumber.
+        :param page: objeto Page do pdfplumber. Não chame page.to_image() neste mesmo objeto antes
+                     da extração, pois a renderização reprocessa a página.
         :return: DataFrame do pandas com os dados extraídos (QTD, CÓDIGO, TITULO),
                  ou None se a extração falhar ou nenhum dado for encontrado.
         """
-        # Extrai todas as palavras da página com tolerâncias justas para melhor agrupamento inicial
+        # Extrai todas as palavras da página com tolerâncias justas para melhor agrupamento inicial.
+        # Esta é a única leitura do conteúdo da página: sem atributos extras por palavra, sem quebra em
+        # pontuação e sem page.chars/page.extract_text() em outro lugar deste extrator.
         words = page.extract_words(keep_blank_chars=False, use_text_flow=True, horizontal_ltr=True, 
-                                   x_tolerance=1, y_tolerance=1) 
+                                   x_tolerance=1, y_tolerance=1, extra_attrs=[], split_at_punctuation=False) 
         if not words:
             self._print_debug("[DEBUG] Nenhuma palavra extraída da página.")
             return None
 
-        page_width = page.width
-        page_height = page.height
+        # Dimensões lidas uma única vez como floats; daqui em diante só valores primitivos são repassados
+        page_width = float(page.width)
+        page_height = float(page.height)
         self._print_debug(f"[DEBUG] Dimensões da página: Largura={page_width}, Altura={page_height}")
 
+        n_words = len(words)
+        texts = [w["text"].strip() if w["text"] else "" for w in words]
+
+        # Classifica cada palavra como cabeçalho (índice em HEADER_KEYS) ou não (-1) numa só passada,
+        # com uma única consulta de dicionário por palavra
+        header_lookup = self._header_lookup.get
+        header_lengths = self._header_lengths
+        tipos_cabecalho = np.fromiter(
+            (-1 if t.isascii() and len(t) not in header_lengths else header_lookup(t.upper(), -1) for t in texts),
+            np.int8, n_words)
+
+        # Páginas que não têm todos os cabeçalhos essenciais (ex.: páginas que não são de orçamento)
+        # são descartadas aqui, por uma máscara de bits, antes de qualquer outro trabalho
+        headers_vistos = int(np.bitwise_or.reduce(np.left_shift(1, tipos_cabecalho[tipos_cabecalho >= 0])))
+        if headers_vistos != self.HEADERS_ESSENCIAIS_MASK:
+            self._print_debug(f"[DEBUG] Página sem todos os cabeçalhos essenciais ({', '.join(self.HEADER_KEYS)}); extração ignorada.")
+            return None
+
+        # Converte a lista de dicionários em vetores paralelos (um por atributo), percorrendo
+        # `words` uma única vez; todos os filtros seguintes são máscaras NumPy sobre estes vetores.
+        x0 = np.fromiter((w["x0"] for w in words), np.float32, n_words)
+        x1 = np.fromiter((w["x1"] for w in words), np.float32, n_words)
+        top = np.fromiter((w["top"] for w in words), np.float32, n_words)
+        bottom = np.fromiter((w["bottom"] for w in words), np.float32, n_words)
+
         # Encontra os cabeçalhos e define os limites das colunas de interesse
         headers_info, header_y_bottom_level, column_xbounds = \
-            self._encontrar_limites_colunas_cabecalho(words, page_width, page_height)
+            self._encontrar_limites_colunas_cabecalho(words, tipos_cabecalho, page_width, page_height)
 
         if not headers_info or not column_xbounds or not all(k in column_xbounds for k in [self.COL_QTD, self.COL_CODIGO, self.COL_TITULO]):
             self._print_debug("[DEBUG] Falha ao localizar cabeçalhos ou definir limites de coluna na extração principal.")
             return None
 
         # Filtra palavras que estão abaixo da linha do cabeçalho
-        data_words = [w for w in words if w["top"] > header_y_bottom_level + 1] # +1 para um pequeno espaço
+        data_mask = top > header_y_bottom_level + 1 # +1 para um pequeno espaço
         
         # Define o limite Y inferior para parar de coletar dados (fim da tabela de itens)
         y_stop_limit = page_height 
-        summary_line_anchors = ["Troca / R&I", "Troca/R&I", "TROCA / R&I", "TROCA/R&I"] # Variações da âncora
         
         candidate_summary_lines_y = []
-        for word in data_words: # Procura a âncora nas palavras da área de dados
-            cleaned_word_text = word["text"].strip() if word["text"] else ""
-            if any(anchor.upper() in cleaned_word_text.upper() for anchor in summary_line_anchors):
-                # A linha de resumo "Troca / R&I..." geralmente começa bem à esquerda
-                if word["x0"] < page_width * 0.20: # Verifica se a palavra está na parte esquerda da página
-                    candidate_summary_lines_y.append(word["top"])
+        # A linha de resumo "Troca / R&I..." geralmente começa bem à esquerda: só as palavras da área de dados
+        # na parte esquerda da página são testadas, com uma única conversão para maiúsculas por palavra
+        for idx in np.flatnonzero(data_mask & (x0 < page_width * 0.20)).tolist():
+            if self.SUMMARY_ANCHOR_RE.search(texts[idx].upper()):
+                candidate_summary_lines_y.append(top[idx])
         
         if candidate_summary_lines_y:
             y_stop_limit = min(candidate_summary_lines_y) - 2 # Pega a âncora mais alta e para um pouco antes
@@ -198,153 +343,110 @@ class ExtratorTabelaPDF:
             # mas para este caso, a ausência pode indicar que a tabela vai até o fim ou outro problema.
             self._print_debug(f"[DEBUG] Âncora de fim de tabela (ex: 'Troca / R&I') não encontrada na posição esperada. Processando até o fim da página ou próximo stop word.")
         
-        data_words = [w for w in data_words if w["top"] < y_stop_limit] # Filtra palavras acima do limite de parada
-        if not data_words:
+        data_mask &= top < y_stop_limit # Filtra palavras acima do limite de parada
+        data_idx = np.flatnonzero(data_mask)
+        if data_idx.size == 0:
             self._print_debug("[DEBUG] Nenhuma palavra de dados encontrada na área da tabela principal (abaixo do cabeçalho e antes do y_stop_limit).")
             return None
 
-        # Agrupa palavras em "linhas candidatas" com base na proximidade vertical
-        lines_raw = defaultdict(list)
+        # Agrupa palavras em "linhas candidatas" com base na proximidade vertical: ordena as palavras
+        # pelo centro vertical e abre uma nova linha sempre que o salto em relação à palavra anterior
+        # atinge a tolerância. Custo O(N log N), sem comparar cada palavra com todas as linhas abertas.
         line_y_tolerance_raw = 2.5 # Tolerância vertical para agrupar palavras na mesma linha
-        for word in data_words:
-            word_v_center = (word["top"] + word["bottom"]) / 2 # Centro vertical da palavra
-            matched_y_key = None
-            for y_key in lines_raw.keys(): # y_key é o centro vertical da primeira palavra da linha
-                if abs(word_v_center - y_key) < line_y_tolerance_raw:
-                    matched_y_key = y_key
-                    break
-            if matched_y_key is None: matched_y_key = word_v_center # Cria uma nova linha
-            lines_raw[matched_y_key].append(word)
-
-        # Processa as linhas candidatas para montar as linhas da tabela e fundir títulos
-        processed_rows = []
-        sorted_y_keys_raw = sorted(lines_raw.keys()) # Processa linhas de cima para baixo
-        
-        for y_key in sorted_y_keys_raw:
-            line_words = sorted(lines_raw[y_key], key=lambda w: w["x0"]) # Ordena palavras da linha por x0
-            if not line_words: continue
-
-            # Monta o texto para cada coluna nesta linha candidata
-            current_row_assembly = {self.COL_QTD: [], self.COL_CODIGO: [], self.COL_TITULO: []}
-            for word in line_words:
-                word_text_clean = word["text"].strip() if word["text"] else ""
-                if not word_text_clean: continue
-                
-                best_fit_col = None
-                word_center_x = (word["x0"] + word["x1"]) / 2
-                
-                # Tenta encaixar a palavra na coluna baseada no centro ou sobreposição significativa
-                for col_name, (x0_c, x1_c, _, _) in column_xbounds.items():
-                    is_center_in_col = x0_c <= word_center_x < x1_c
-                    
-                    overlap_start = max(word["x0"], x0_c)
-                    overlap_end = min(word["x1"], x1_c)
-                    overlap_width = overlap_end - overlap_start
-                    word_width = word["x1"] - word["x0"]
-                    # Considera sobreposição significativa se for >40% da palavra ou >5 pixels absolutos
-                    significant_overlap = (word_width > 0 and (overlap_width / word_width) > 0.4) or overlap_width > 5
-
-                    if is_center_in_col or significant_overlap:
-                        # Prioriza colunas mais à esquerda se houver ambiguidade de encaixe
-                        if col_name == self.COL_QTD or col_name == self.COL_CODIGO:
-                            if is_center_in_col or significant_overlap: # Condição mais forte
-                               best_fit_col = col_name
-                               break # Encaixou em QTD ou CODIGO, para
-                        elif col_name == self.COL_TITULO: # TITULO é mais flexível
-                            if best_fit_col is None : # Só atribui a TITULO se não encaixou melhor antes
-                                best_fit_col = col_name 
-                
-                if best_fit_col:
-                    current_row_assembly[best_fit_col].append(word_text_clean)
-                # else:
-                #     self._print_debug(f"[DEBUG] Palavra não atribuída: '{word_text_clean}' (x0:{word['x0']:.1f}, x1:{word['x1']:.1f}) Linha Y: {y_key:.1f}")
-
-
-            # Cria um dicionário temporário com os dados da linha bruta
-            temp_row_data = {
-                self.COL_QTD: " ".join(current_row_assembly[self.COL_QTD]).strip(),
-                self.COL_CODIGO: " ".join(current_row_assembly[self.COL_CODIGO]).strip(),
-                self.COL_TITULO: " ".join(current_row_assembly[self.COL_TITULO]).strip()
-            }
+        v_center = (top[data_idx] + bottom[data_idx]) * 0.5 # Centro vertical de cada palavra de dados
+        order = np.argsort(v_center, kind="stable")
+        v_center_sorted = v_center[order]
+        new_line = np.empty(v_center_sorted.shape, dtype=bool)
+        new_line[0] = True
+        new_line[1:] = np.diff(v_center_sorted) >= line_y_tolerance_raw
+        line_id = np.cumsum(new_line) - 1
+
+        # Dentro de cada linha, ordena as palavras por x0 (a linha continua sendo a chave primária)
+        words_by_line = data_idx[order]
+        words_by_line = words_by_line[np.lexsort((x0[words_by_line], line_id))]
+        line_starts = np.flatnonzero(new_line)
+        y_keys = v_center_sorted[line_starts].tolist() # y de cada linha: centro da palavra mais alta
+
+        # Atribui todas as palavras de dados às colunas de uma só vez (índice em DATA_COLUMNS, ou -1)
+        cols_by_line = self._atribuir_colunas(x0[words_by_line], x1[words_by_line], column_xbounds)
+        line_splits = line_starts[1:]
+
+        # Processa as linhas candidatas (de cima para baixo) para montar as linhas da tabela e fundir títulos.
+        # Cada linha aproveitada ocupa uma posição em listas paralelas (uma por coluna), sem um dicionário por linha.
+        row_qtds, row_codigos, row_titulos = [], [], []
+        row_ys = array('f')
+        for y_key, line_idx, line_cols in zip(y_keys, np.split(words_by_line, line_splits), np.split(cols_by_line, line_splits)):
+            # Monta o texto para cada coluna nesta linha candidata (posições na ordem de DATA_COLUMNS)
+            current_row_assembly = ([], [], [])
+            for idx, col in zip(line_idx.tolist(), line_cols.tolist()):
+                word_text_clean = texts[idx]
+                if col >= 0 and word_text_clean:
+                    current_row_assembly[col].append(word_text_clean)
+
+            qtd_texto, codigo_texto, titulo_texto = (" ".join(partes) for partes in current_row_assembly)
             # Adiciona à lista de processamento se tiver QTD ou TITULO (para permitir fusão posterior)
-            if temp_row_data[self.COL_QTD] or temp_row_data[self.COL_TITULO]:
-                processed_rows.append({"data": temp_row_data, "y_level": y_key})
-
-        # Lógica para juntar títulos de múltiplas linhas
-        merged_rows = []
-        i = 0
-        while i < len(processed_rows):
-            current_item = processed_rows[i]["data"]
-            current_y = processed_rows[i]["y_level"]
-            
-            is_current_qtd_valid = False
-            actual_qtd_to_use = ""
-            if current_item[self.COL_QTD]:
+            if qtd_texto or titulo_texto:
+                row_qtds.append(qtd_texto)
+                row_codigos.append(codigo_texto)
+                row_titulos.append(titulo_texto)
+                row_ys.append(y_key)
+
+        # Lógica para juntar títulos de múltiplas linhas: primeiro valida o QTD de cada linha
+        # e monta vetores paralelos; a máquina de estados da fusão roda compilada sobre eles.
+        n_rows = len(row_qtds)
+        qtd_valida = np.zeros(n_rows, dtype=np.bool_)
+        qtd_limpa = [""] * n_rows
+        for r, qtd_bruta in enumerate(row_qtds):
+            if not qtd_bruta:
+                continue
+            # Limpa QTD: pega o último token (geralmente o número "1"); rpartition não aloca a lista de tokens
+            qtd_token = qtd_bruta.rpartition(" ")[2].translate(self.QTD_DECIMAL_TABLE)
+            # Caminho rápido para o caso comum ("1", "1.00"): só dígitos e no máximo um ponto, sem float()/exceção
+            if not qtd_token.replace(".", "", 1).isdecimal():
                 try:
-                    # Limpa QTD: pega o último token (geralmente o número "1") e tenta converter
-                    parts_qtd = current_item[self.COL_QTD].replace(",", ".").strip().split(" ")
-                    actual_qtd_to_use = parts_qtd[-1] 
-                    float(actual_qtd_to_use) # Valida se é numérico
-                    is_current_qtd_valid = True
+                    float(qtd_token) # Valida se é numérico (ex.: "1e3", "-1")
                 except ValueError:
-                    is_current_qtd_valid = False
-
-            # Se a linha atual tem um QTD válido, ela é o início de um item.
-            # Tenta fundir com as próximas linhas se elas parecerem continuações do título.
-            if is_current_qtd_valid:
-                current_item[self.COL_QTD] = actual_qtd_to_use # Usa o QTD limpo
-                j = i + 1
-                while j < len(processed_rows):
-                    next_item_data = processed_rows[j]["data"]
-                    next_y = processed_rows[j]["y_level"]
-
-                    # Verifica se a QTD da próxima linha está vazia ou não é numérica
-                    is_next_qtd_empty_or_invalid = not next_item_data[self.COL_QTD] # Se QTD da próxima linha for vazio
-                    if not is_next_qtd_empty_or_invalid: # Se QTD não for vazio, tenta validar
-                        try:
-                            parts_next_qtd = next_item_data[self.COL_QTD].replace(",", ".").strip().split(" ")
-                            float(parts_next_qtd[-1])
-                            is_next_qtd_empty_or_invalid = False # QTD é válido, então não é uma continuação do título
-                        except ValueError:
-                            is_next_qtd_empty_or_invalid = True # QTD não é numérico, PODE ser continuação
-
-                    is_next_title_present = bool(next_item_data[self.COL_TITULO])
-                    y_merge_tolerance = 15 # Tolerância vertical para considerar linhas como parte do mesmo item
-
-                    # Condições para fusão: próxima linha não tem QTD válido, tem título, e está próxima verticalmente
-                    if is_next_qtd_empty_or_invalid and is_next_title_present and (next_y - current_y) < y_merge_tolerance:
-                        self._print_debug(f"[DEBUG] Juntando TITULO: '{current_item[self.COL_TITULO]}' + '{next_item_data[self.COL_TITULO]}'")
-                        current_item[self.COL_TITULO] += " " + next_item_data[self.COL_TITULO]
-                        current_item[self.COL_TITULO] = current_item[self.COL_TITULO].strip() # Remove espaços extras
-                        current_y = next_y # Atualiza o y_level para a próxima comparação de fusão
-                        j += 1
-                    else:
-                        break # Próxima linha não é uma continuação do título
-                merged_rows.append(current_item)
-                i = j # Pula para a próxima linha após as que foram fundidas
+                    continue # QTD não é numérico: a linha PODE ser continuação de título
+            qtd_limpa[r] = qtd_token
+            qtd_valida[r] = True
+        tem_titulo = np.fromiter((bool(titulo) for titulo in row_titulos), np.bool_, n_rows)
+        y_rows = np.frombuffer(row_ys, dtype=np.float32)
+        y_merge_tolerance = 15 # Tolerância vertical para considerar linhas como parte do mesmo item
+
+        qtds, codigos, titulos = [], [], []
+        linhas_usadas = 0
+        for start, end in _obter_intervalos_fusao_titulos()(qtd_valida, tem_titulo, y_rows, y_merge_tolerance).tolist():
+            linhas_usadas += end - start
+            qtds.append(qtd_limpa[start]) # Usa o QTD limpo
+            codigos.append(row_codigos[start])
+            if end - start > 1:
+                self._print_debug(f"[DEBUG] Juntando TITULO: {row_titulos[start:end]}")
+                titulos.append(" ".join(row_titulos[start:end]).strip())
             else:
-                # Se a linha atual não tem QTD válido, ela é descartada (a menos que seja fundida de alguma forma)
-                self._print_debug(f"[DEBUG] Linha Inicial Descartada (QTD inválido/ausente '{current_item[self.COL_QTD]}' e não parte de fusão): {current_item}")
-                i += 1
-                
-        if not merged_rows:
+                titulos.append(row_titulos[start])
+        if linhas_usadas < n_rows:
+            # Linhas sem QTD válido que não foram fundidas a um item são descartadas
+            self._print_debug(f"[DEBUG] {n_rows - linhas_usadas} linha(s) descartada(s) (QTD inválido/ausente e não parte de fusão).")
+
+        if not qtds:
             self._print_debug("[DEBUG] Nenhuma linha de dados formatada após tentativa de fusão.")
             return None
-            
-        df_result = pd.DataFrame(merged_rows)
-        if df_result.empty: return None
 
-        # Garante a ordem correta das colunas e que todas as colunas de interesse estejam presentes
-        final_columns_ordered = [self.COL_QTD, self.COL_CODIGO, self.COL_TITULO] 
-        for col_name in final_columns_ordered:
-            if col_name not in df_result.columns:
-                df_result[col_name] = "" # Adiciona coluna vazia se não existir
-        return df_result[final_columns_ordered]
+        # Monta o DataFrame direto das três colunas, já com os tipos finais: QTD numérico (inteiro pequeno
+        # quando possível) e textos como strings Arrow. Evita a inferência de tipos linha a linha do pandas
+        # e a transposição de uma lista de dicionários.
+        import pandas as pd
+        return pd.DataFrame({
+            self.COL_QTD: pd.to_numeric(qtds, errors='coerce', downcast='integer'),
+            self.COL_CODIGO: pd.array(codigos, dtype='string[pyarrow]'),
+            self.COL_TITULO: pd.array(titulos, dtype='string[pyarrow]'),
+        }, copy=False)
 
     def _salvar_imagem_debug(self, page, pagina_num, caminho_base_pdf):
-        """ Salva uma imagem de depuração da página PDF, se self.debug_image for True. """
-        if not self.debug_image:
-            return
+        """
+        Salva uma imagem de depuração da página PDF.
+        Renderizar a página é caro; o chamador só deve invocar este método se self.debug_image for True.
+        """
         try:
             # Define o diretório para salvar a imagem de depuração
             dir_debug_img = self.base_path if self.base_path else os.path.dirname(caminho_base_pdf)
@@ -358,7 +460,8 @@ class ExtratorTabelaPDF:
             nome_base_pdf_img = os.path.splitext(os.path.basename(caminho_base_pdf))[0]
             path_img_debug = os.path.join(dir_debug_img, f"{nome_base_pdf_img}_pagina_{pagina_num}_visual_debug.png")
             
-            page.to_image(resolution=150).save(path_img_debug, format="PNG")
+            # 72 dpi sem antialiasing basta para conferir as faixas; compress_level=1 reduz o tempo gasto no zlib
+            page.to_image(resolution=72, antialias=False).save(path_img_debug, format="PNG", optimize=False, compress_level=1)
             self._print_debug(f"[DEBUG] Imagem de depuração visual da página salva em: {path_img_debug}")
         except Exception as e_img_save:
             self._print_debug(f"[DEBUG] Não foi possível salvar imagem de depuração visual da página: {e_img_save}")
@@ -367,49 +470,67 @@ class ExtratorTabelaPDF:
         """
         Processa o arquivo PDF fornecido, extrai a tabela de itens da primeira página.
 
-        :param caminho_pdf: str, caminho para o arquivo PDF.
+        :param caminho_pdf: str ou os.PathLike, caminho para o arquivo PDF; ou um objeto
+                            file-like binário (ex.: BytesIO) com o conteúdo do PDF já em memória.
         :return: DataFrame do pandas com os dados extraídos, ou None se ocorrer um erro.
         """
         dataframe_resultado_final = None
-        if not os.path.isfile(caminho_pdf):
-            print(f"[ERRO] Arquivo PDF não encontrado: {caminho_pdf}")
-            return None
+        if isinstance(caminho_pdf, (str, os.PathLike)):
+            if not os.path.isfile(caminho_pdf):
+                print(f"[ERRO] Arquivo PDF não encontrado: {caminho_pdf}")
+                return None
+            nome_pdf = caminho_pdf
+        else:
+            nome_pdf = getattr(caminho_pdf, "name", "pdf_em_memoria") # Usado apenas em logs e na imagem de depuração
         try:
-            with pdfplumber.open(caminho_pdf) as pdf_doc:
+            import pdfplumber
+            # laparams=None (padrão) mantém desligada a análise de layout do pdfminer, que extract_words não usa
+            with pdfplumber.open(caminho_pdf, laparams=None) as pdf_doc:
                 if pdf_doc.pages:
                     pagina_alvo = pdf_doc.pages[0] # Processa apenas a primeira página
                     self._print_debug(f"\n[DEBUG] Processando Página 1 de {len(pdf_doc.pages)} com extração baseada em texto.")
                     
-                    # Salva imagem de depuração se a flag estiver ativa
-                    self._salvar_imagem_debug(pagina_alvo, 1, caminho_pdf)
-                    
                     dataframe_resultado_final = self._extrair_dados_baseado_em_texto(pagina_alvo)
+
+                    # Salva imagem de depuração apenas se a flag estiver ativa (a renderização é cara).
+                    # Fica depois da extração: page.to_image reprocessa a página e não deve vir antes dela.
+                    if self.debug_image:
+                        self._salvar_imagem_debug(pagina_alvo, 1, nome_pdf)
                 else:
                     self._print_debug("[ERRO] O PDF não contém páginas.")
             return dataframe_resultado_final
         except Exception as e_main:
-            print(f"Erro CRÍTICO durante o processamento do PDF '{caminho_pdf}': {e_main}")
+            print(f"Erro CRÍTICO durante o processamento do PDF '{nome_pdf}': {e_main}")
             import traceback
             traceback.print_exc() # Imprime o traceback completo para depuração
             return None
 
-    def salvar_resultado_excel(self, dataframe, caminho_pdf_original, nome_arquivo_saida_opcional=None):
+    def salvar_resultado_excel(self, dataframe, caminho_pdf_original, nome_arquivo_saida_opcional=None, formato_saida="xlsx"):
         """
-        Salva o DataFrame fornecido em um arquivo Excel (.xlsx).
+        Salva o DataFrame fornecido em um arquivo Excel (.xlsx) ou, opcionalmente, Parquet.
 
         :param dataframe: DataFrame do pandas a ser salvo.
         :param caminho_pdf_original: str, caminho do PDF original, usado para gerar o nome do arquivo de saída.
-        :param nome_arquivo_saida_opcional: str, opcional, nome completo do arquivo de saída.
+        :param nome_arquivo_saida_opcional: str, opcional, nome completo do arquivo de saída, ou um objeto de
+                                             arquivo binário (ex.: BytesIO) para gravar em memória.
                                              Se None, um nome será gerado automaticamente.
-        :return: str, caminho do arquivo Excel salvo, ou None se ocorrer um erro.
+        :param formato_saida: str, "xlsx" (padrão) ou "parquet" (para quem encadeia o resultado em outras ferramentas).
+        :return: str, caminho do arquivo salvo (ou o objeto de arquivo recebido, reposicionado no início),
+                 ou None se ocorrer um erro.
         """
         if dataframe is None or dataframe.empty:
             print("Nenhum dado para salvar em Excel.")
             return None 
+        if formato_saida not in self.FORMATOS_SAIDA:
+            print(f"Formato de saída não suportado: '{formato_saida}'. Use um de {self.FORMATOS_SAIDA}.")
+            return None
 
         try:
             # Define o caminho de saída
-            if nome_arquivo_saida_opcional:
+            if hasattr(nome_arquivo_saida_opcional, 'write'): # Destino em memória: nada a criar em disco
+                caminho_completo_saida = nome_arquivo_saida_opcional
+                dir_saida = None
+            elif nome_arquivo_saida_opcional:
                 caminho_completo_saida = nome_arquivo_saida_opcional
                 dir_saida = os.path.dirname(caminho_completo_saida)
                 if not dir_saida: dir_saida = '.' # Diretório atual se apenas nome do arquivo for fornecido
@@ -420,36 +541,262 @@ class ExtratorTabelaPDF:
                 nome_arquivo_base_pdf = os.path.splitext(os.path.basename(caminho_pdf_original))[0]
                 subdiretorio_saida = "excel_saida" # Nome da pasta padrão para os Excels
                 dir_saida = os.path.join(diretorio_pdf, subdiretorio_saida)
-                caminho_completo_saida = os.path.join(dir_saida, f"{nome_arquivo_base_pdf}_extracao.xlsx")
+                caminho_completo_saida = os.path.join(dir_saida, f"{nome_arquivo_base_pdf}_extracao.{formato_saida}")
 
-            os.makedirs(dir_saida, exist_ok=True) # Cria o diretório de saída se não existir
-            dataframe.to_excel(caminho_completo_saida, index=False, engine='openpyxl')
-            print(f"Planilha Excel salva com sucesso em: {caminho_completo_saida}")
+            if dir_saida:
+                os.makedirs(dir_saida, exist_ok=True) # Cria o diretório de saída se não existir
+            if formato_saida == "parquet":
+                dataframe.to_parquet(caminho_completo_saida, index=False, engine='pyarrow', compression='zstd')
+                if dir_saida is None:
+                    caminho_completo_saida.seek(0)
+                    print("Arquivo Parquet gerado em memória.")
+                else:
+                    print(f"Arquivo Parquet salvo com sucesso em: {caminho_completo_saida}")
+                return caminho_completo_saida
+
+            import pandas as pd
+            if XLSXWRITER_DISPONIVEL:
+                # xlsxwriter guarda só os valores de cada célula, sem os objetos Cell do openpyxl. Sem constant_memory:
+                # o pandas escreve coluna por coluna e, nesse modo, o xlsxwriter descarta o que chega para linhas já gravadas.
+                opcoes_writer = {'engine': 'xlsxwriter',
+                                 'engine_kwargs': {'options': {'strings_to_formulas': False,
+                                                               'strings_to_urls': False}}}
+            else:
+                opcoes_writer = {'engine': 'openpyxl'}
+            with pd.ExcelWriter(caminho_completo_saida, **opcoes_writer) as writer:
+                dataframe.to_excel(writer, index=False)
+            if dir_saida is None:
+                caminho_completo_saida.seek(0)
+                print("Planilha Excel gerada em memória.")
+            else:
+                print(f"Planilha Excel salva com sucesso em: {caminho_completo_saida}")
             return caminho_completo_saida 
         except Exception as e:
             print(f"Erro ao salvar o arquivo Excel: {e}")
             return None
 
 
+# --- Processamento de PDFs em processos separados ---
+MAX_PROCESSOS_EXTRACAO = 4 # Acima disso o ganho é pequeno e o custo de memória de cada processo cresce
+# Cada worker do gunicorn tem o seu próprio pool: os núcleos são divididos entre os workers
+# (WEB_CONCURRENCY, que o gunicorn também usa como número de workers) para que o total de
+# processos de extração não passe do número de CPUs. PDF2XLSX_PROCESSOS fixa o tamanho do pool.
+_WORKERS_WEB = max(1, int(os.environ.get('WEB_CONCURRENCY', '1')))
+PROCESSOS_EXTRACAO = (int(os.environ.get('PDF2XLSX_PROCESSOS', '0'))
+                      or max(1, min((os.cpu_count() or 1) // _WORKERS_WEB, MAX_PROCESSOS_EXTRACAO)))
+
+_EXTRATOR = None # Extrator de um processo do pool, criado por _init_worker e reaproveitado entre tarefas
+_POOL_EXTRACAO = None # Pool compartilhado entre requisições, criado no primeiro envio com vários PDFs
+_POOL_EXTRACAO_LOCK = threading.Lock()
+
+def _init_worker(upload_folder):
+    """
+    Inicializa um processo do pool: cria o extrator usado por todas as tarefas do processo
+    e antecipa as importações e a carga da função compilada, que de outro modo recairiam
+    sobre o primeiro PDF processado.
+
+    :param upload_folder: str, pasta base passada ao extrator.
+    """
+    global _EXTRATOR
+    # debug=False: com vários processos as mensagens de depuração se misturam na saída
+    _EXTRATOR = ExtratorTabelaPDF(debug=False, debug_image=False, base_path=upload_folder)
+    import pandas # noqa: F401
+    import pdfplumber # noqa: F401
+    _obter_intervalos_fusao_titulos()(np.zeros(0, dtype=np.bool_), np.zeros(0, dtype=np.bool_), np.zeros(0, dtype=np.float32), 15)
+
+def _obter_pool_extracao():
+    """
+    Devolve o pool de processos de extração, criando-o na primeira chamada. Manter o pool
+    entre requisições evita recriar os processos (e refazer _init_worker) a cada envio.
+
+    :return: ProcessPoolExecutor compartilhado.
+    """
+    global _POOL_EXTRACAO
+    with _POOL_EXTRACAO_LOCK:
+        if _POOL_EXTRACAO is None:
+            _POOL_EXTRACAO = ProcessPoolExecutor(max_workers=PROCESSOS_EXTRACAO,
+                                                 initializer=_init_worker, initargs=(UPLOAD_FOLDER,))
+        return _POOL_EXTRACAO
+
+def _descartar_pool_extracao(pool):
+    """
+    Descarta um pool quebrado (ex.: processo morto pelo sistema) para que o próximo envio crie outro.
+
+    :param pool: ProcessPoolExecutor que levantou BrokenProcessPool.
+    """
+    global _POOL_EXTRACAO
+    with _POOL_EXTRACAO_LOCK:
+        if _POOL_EXTRACAO is pool:
+            _POOL_EXTRACAO = None
+    pool.shutdown(wait=False)
+
+def _processar_um_pdf(conteudo_pdf, nome_original, caminho_excel_saida):
+    """
+    Extrai a tabela de um PDF recebido em bytes e grava o resultado em Excel. Fica no
+    nível do módulo para poder ser enviada a um ProcessPoolExecutor.
+
+    O Excel é gravado pelo próprio processo que fez a extração; só o caminho do arquivo
+    volta ao processo principal, em vez do DataFrame serializado.
+
+    :param conteudo_pdf: bytes, conteúdo do arquivo PDF.
+    :param nome_original: str, nome do PDF enviado (usado nas mensagens e nos logs).
+    :param caminho_excel_saida: str, caminho onde o arquivo .xlsx deve ser gravado, ou BytesIO
+                                para gravá-lo em memória (só no processo principal: não atravessa o pool).
+    :return: dict com "original_name" e "excel_path" (o caminho ou o BytesIO recebido; None em caso
+             de falha) e, em caso de falha, "erro" com a mensagem a ser exibida ao usuário.
+    """
+    extrator = _EXTRATOR # Nos processos do pool, o extrator criado por _init_worker
+    if extrator is None: # Processo principal (envio de um único PDF)
+        extrator = ExtratorTabelaPDF(debug=True, debug_image=False, base_path=UPLOAD_FOLDER)
+    df_extraido = extrator.processar_pdf(BytesIO(conteudo_pdf))
+    if df_extraido is None or df_extraido.empty:
+        return {"original_name": nome_original, "excel_path": None,
+                "erro": f'Não foram extraídos dados do PDF "{nome_original}" ou o resultado estava vazio.'}
+
+    caminho_excel_gerado = extrator.salvar_resultado_excel(df_extraido, nome_original,
+                                                           nome_arquivo_saida_opcional=caminho_excel_saida)
+    if caminho_excel_gerado is None or (isinstance(caminho_excel_gerado, str) and not os.path.exists(caminho_excel_gerado)):
+        return {"original_name": nome_original, "excel_path": None,
+                "erro": f'Falha ao gerar o arquivo Excel para "{nome_original}".'}
+    return {"original_name": nome_original, "excel_path": caminho_excel_gerado}
+
+MAX_PLANILHAS_EM_CACHE = 64 # Planilhas (bytes do XLSX) guardadas por processo, das usadas mais recentemente
+_CACHE_PLANILHAS = OrderedDict() # SHA-256 do PDF -> bytes do XLSX gerado a partir dele
+_CACHE_PLANILHAS_LOCK = threading.Lock()
+
+def _planilha_em_cache(chave_conteudo):
+    """
+    Procura a planilha já gerada para um PDF de mesmo conteúdo.
+
+    :param chave_conteudo: str, SHA-256 (hex) do conteúdo do PDF.
+    :return: bytes do XLSX, ou None se o PDF ainda não foi processado (ou saiu do cache).
+    """
+    with _CACHE_PLANILHAS_LOCK:
+        dados = _CACHE_PLANILHAS.get(chave_conteudo)
+        if dados is not None:
+            _CACHE_PLANILHAS.move_to_end(chave_conteudo)
+        return dados
+
+def _guardar_planilha_em_cache(chave_conteudo, dados):
+    """
+    Guarda a planilha gerada para um PDF, descartando as menos usadas acima de MAX_PLANILHAS_EM_CACHE.
+
+    :param chave_conteudo: str, SHA-256 (hex) do conteúdo do PDF.
+    :param dados: bytes do XLSX.
+    """
+    with _CACHE_PLANILHAS_LOCK:
+        _CACHE_PLANILHAS[chave_conteudo] = dados
+        _CACHE_PLANILHAS.move_to_end(chave_conteudo)
+        while len(_CACHE_PLANILHAS) > MAX_PLANILHAS_EM_CACHE:
+            _CACHE_PLANILHAS.popitem(last=False)
+
+def _resultado_com_erro(nome_original, erro):
+    """
+    Monta o resultado de um PDF cujo processamento levantou uma exceção.
+
+    :param nome_original: str, nome do PDF enviado.
+    :param erro: Exception levantada durante o processamento.
+    :return: dict no mesmo formato devolvido por _processar_um_pdf.
+    """
+    app.logger.error("Erro ao processar o arquivo %s: %s", nome_original, erro, exc_info=erro)
+    return {"original_name": nome_original, "excel_path": None,
+            "erro": f'Erro ao processar o arquivo "{nome_original}". Verifique os logs do servidor.'}
+
+
 # --- Configuração e Rotas do Flask App ---
+class RequisicaoUploadEmMemoria(Request):
+    """
+    Requisição que mantém os arquivos enviados em memória.
+    Por padrão o Werkzeug grava uploads acima de 500 KB num arquivo temporário, que a rota
+    leria de volta por inteiro logo em seguida; aqui cada parte do multipart vai direto
+    para um BytesIO.
+    """
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return BytesIO()
+
 app = Flask(__name__)
+app.request_class = RequisicaoUploadEmMemoria
 app.secret_key = os.urandom(24) # Chave secreta para mensagens flash e sessões
 
-# Define pastas para upload e saída. Estas serão criadas no mesmo diretório do app.py.
+# Define pastas para upload e saída. Ficam em PDF2XLSX_TMP ou, por padrão, em /dev/shm (tmpfs, em memória)
+# quando existe, para que os arquivos intermediários não passem pelo disco; sem /dev/shm, no diretório do app.py.
 BASE_DIR = os.path.abspath(os.path.dirname(__file__))
-UPLOAD_FOLDER = os.path.join(BASE_DIR, 'arquivos_pdf_enviados') # Nome de pasta mais descritivo
-OUTPUT_FOLDER = os.path.join(BASE_DIR, 'arquivos_excel_gerados') # Nome de pasta mais descritivo
-os.makedirs(UPLOAD_FOLDER, exist_ok=True)
-os.makedirs(OUTPUT_FOLDER, exist_ok=True)
+
+def _pasta_tmpfs_privada():
+    """
+    Prepara /dev/shm/pdf2xlsx como pasta temporária padrão. /dev/shm é gravável por todos os
+    usuários: a pasta é criada com acesso só do dono (0700) e, se já existir, precisa ser um
+    diretório deste usuário sem acesso para outros. Caso contrário (ex.: criada antes por outro
+    usuário), usa uma pasta nova de nome aleatório, apagada quando o processo que a criou termina.
+    Se /dev/shm não puder ser usado (ex.: sem permissão de escrita), usa o diretório do app.py.
+
+    :return: str, caminho da pasta temporária.
+    """
+    caminho = '/dev/shm/pdf2xlsx'
+    try:
+        try:
+            os.mkdir(caminho, 0o700)
+        except FileExistsError:
+            pass
+        info = os.lstat(caminho) # lstat: um link simbólico no lugar da pasta não é seguido
+        if stat.S_ISDIR(info.st_mode) and info.st_uid == os.getuid() and not info.st_mode & 0o077:
+            return caminho
+        app.logger.warning("%s não pertence a este usuário ou é acessível a outros; usando uma pasta temporária nova.", caminho)
+        pasta_nova = tempfile.mkdtemp(prefix='pdf2xlsx-', dir='/dev/shm')
+    except OSError as e:
+        app.logger.warning("Não foi possível usar /dev/shm (%s); usando o diretório do app.py.", e)
+        return BASE_DIR
+    # Só o processo que criou a pasta a apaga: os workers criados por fork herdam o atexit
+    pid_criador = os.getpid()
+    atexit.register(lambda: os.getpid() == pid_criador and shutil.rmtree(pasta_nova, ignore_errors=True))
+    return pasta_nova
+
+if 'PDF2XLSX_TMP' in os.environ:
+    PASTA_TEMPORARIA = os.environ['PDF2XLSX_TMP']
+elif os.path.isdir('/dev/shm'):
+    PASTA_TEMPORARIA = _pasta_tmpfs_privada()
+else:
+    PASTA_TEMPORARIA = BASE_DIR
+UPLOAD_FOLDER = os.path.join(PASTA_TEMPORARIA, 'arquivos_pdf_enviados') # Nome de pasta mais descritivo
+OUTPUT_FOLDER = os.path.join(PASTA_TEMPORARIA, 'arquivos_excel_gerados') # Nome de pasta mais descritivo
+os.makedirs(UPLOAD_FOLDER, mode=0o700, exist_ok=True)
+os.makedirs(OUTPUT_FOLDER, mode=0o700, exist_ok=True)
+
+# Log da aplicação em arquivo, só quando PDF2XLSX_LOG é definido; sem ele, fica o handler padrão do Flask
+# (stderr). Vários workers escrevem no mesmo arquivo, então nenhum deles o rotaciona: a rotação fica a cargo
+# do logrotate e o WatchedFileHandler reabre o arquivo quando ele é trocado.
+ARQUIVO_LOG = os.environ.get('PDF2XLSX_LOG')
+if ARQUIVO_LOG:
+    _handler_log = WatchedFileHandler(ARQUIVO_LOG, encoding='utf-8') # Abre já: um caminho sem permissão falha na carga
+    _handler_log.setFormatter(logging.Formatter('%(asctime)s [%(process)d] %(levelname)s %(message)s'))
+    app.logger.addHandler(_handler_log)
+app.logger.setLevel(logging.INFO) # O servidor de desenvolvimento (bloco __main__) passa para DEBUG
 
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['OUTPUT_FOLDER'] = OUTPUT_FOLDER
-ALLOWED_EXTENSIONS = {'pdf'} # Apenas arquivos PDF são permitidos
+app.config['MAX_CONTENT_LENGTH'] = 100 * 1024 * 1024 # Envios maiores (soma dos arquivos) são recusados com 413
+# Nível de compressão do ZIP com várias planilhas: 0 (padrão) armazena sem recomprimir, 1 a 9 usam deflate
+ZIP_NIVEL_COMPRESSAO = min(max(int(os.environ.get('PDF2XLSX_ZIP_LEVEL', '0')), 0), 9)
+# Com PDF2XLSX_X_SENDFILE=1 o download de planilha única é só um cabeçalho X-Sendfile: o servidor web à frente
+# do Flask (Apache com mod_xsendfile, lighttpd) envia o arquivo e o worker fica livre. Nesse modo o XLSX precisa
+# continuar em disco após a resposta, então é apagado depois, pela varredura de saídas antigas.
+app.config['USE_X_SENDFILE'] = os.environ.get('PDF2XLSX_X_SENDFILE', '0') == '1'
+IDADE_MAXIMA_SAIDA_SEGUNDOS = 600 # Tempo que um XLSX entregue via X-Sendfile permanece em OUTPUT_FOLDER
+ALLOWED_EXTENSIONS = frozenset({'pdf'}) # Apenas arquivos PDF são permitidos
 
 def allowed_file(filename):
     """Verifica se a extensão do arquivo é permitida."""
-    return '.' in filename and \
-           filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
+    # rpartition não monta a lista que o rsplit criaria; sem '.', o separador vem vazio
+    _, separador, extensao = filename.rpartition('.')
+    return bool(separador) and extensao.lower() in ALLOWED_EXTENSIONS
+
+def parece_pdf(conteudo):
+    """
+    Verifica se o conteúdo tem a assinatura de um PDF ("%PDF-"), que os leitores aceitam
+    em qualquer posição do primeiro KB. Barra arquivos que só têm a extensão .pdf antes
+    de ocuparem o pdfplumber.
+    """
+    return conteudo.find(b'%PDF-', 0, 1024) != -1
 
 # Template HTML para a página de upload (com Tailwind CSS - Cores Verdes)
 HTML_FORM = """
@@ -519,6 +866,52 @@ HTML_FORM = """
 </body>
 </html>
 """
+# Compilado uma única vez; renderizar a partir da string a cada GET repetiria o parse do Jinja.
+FORM_TEMPLATE = app.jinja_env.from_string(HTML_FORM)
+# Sem mensagens flash pendentes o formulário é sempre o mesmo: é renderizado uma vez e servido como
+# bytes prontos, com ETag para que o navegador revalide com um 304 em vez de baixá-lo de novo.
+with app.test_request_context():
+    FORM_HTML_BYTES = FORM_TEMPLATE.render().encode('utf-8')
+FORM_ETAG = hashlib.md5(FORM_HTML_BYTES).hexdigest()
+# Versões já comprimidas do formulário, na ordem de preferência: calculadas uma vez, no nível máximo,
+# já que o custo fica na importação e não em cada requisição.
+FORM_HTML_COMPRIMIDO = []
+if brotli is not None:
+    FORM_HTML_COMPRIMIDO.append(('br', brotli.compress(FORM_HTML_BYTES, quality=11)))
+FORM_HTML_COMPRIMIDO.append(('gzip', gzip.compress(FORM_HTML_BYTES, compresslevel=9)))
+
+TIPOS_COMPRIMIVEIS = frozenset({'text/html'}) # Respostas de texto que valem a pena comprimir
+TAMANHO_MINIMO_COMPRESSAO = 1024 # Bytes; abaixo disso o gzip não compensa
+
+@app.errorhandler(413)
+def envio_grande_demais(erro):
+    """Responde a envios acima de MAX_CONTENT_LENGTH voltando ao formulário com uma mensagem."""
+    limite_mb = app.config['MAX_CONTENT_LENGTH'] // (1024 * 1024)
+    flash(f'Envio grande demais. O limite é de {limite_mb} MB somando todos os arquivos.', 'error')
+    return redirect(url_for('rota_upload_arquivo'))
+
+@app.after_request
+def comprimir_resposta_html(response):
+    """
+    Comprime com gzip as respostas HTML quando o cliente aceita essa codificação.
+    Arquivos enviados (XLSX, ZIP) passam direto, sem compressão.
+    """
+    if (response.direct_passthrough
+            or response.status_code != 200
+            or response.mimetype not in TIPOS_COMPRIMIVEIS
+            or 'Content-Encoding' in response.headers
+            or not request.accept_encodings['gzip']):
+        return response
+    corpo = response.get_data()
+    if len(corpo) < TAMANHO_MINIMO_COMPRESSAO:
+        return response
+    response.set_data(gzip.compress(corpo, compresslevel=6))
+    response.headers['Content-Encoding'] = 'gzip'
+    etag, fraca = response.get_etag()
+    if etag and not fraca: # O corpo mudou de codificação: a ETag passa a indicar só equivalência
+        response.set_etag(etag, weak=True)
+    response.vary.add('Accept-Encoding')
+    return response
 
 @app.after_request
 def remove_temporary_files(response):
@@ -526,17 +919,120 @@ def remove_temporary_files(response):
     Função de limpeza executada após cada requisição.
     Remove os arquivos temporários (PDFs, XLSX, ZIP) que foram marcados para remoção.
     """
-    files_to_remove_list = getattr(g, 'files_to_remove', [])
-    for f_path in files_to_remove_list:
-        try:
-            if f_path and os.path.exists(f_path):
-                os.remove(f_path)
-                print(f"Arquivo temporário removido: {f_path}")
-        except Exception as e:
-            print(f"Erro ao remover arquivo temporário {f_path}: {e}")
+    _remover_arquivos_temporarios(getattr(g, 'files_to_remove', ()))
     return response
 
 
+def _remover_arquivos_temporarios(caminhos):
+    """
+    Apaga os arquivos temporários indicados. Um único unlink por arquivo: o que já não
+    existir é ignorado, sem uma consulta prévia ao sistema de arquivos.
+
+    :param caminhos: iterável de caminhos de arquivos a remover.
+    """
+    for f_path in caminhos:
+        try:
+            os.unlink(f_path)
+        except FileNotFoundError:
+            continue
+        except OSError as e:
+            app.logger.warning("Erro ao remover arquivo temporário %s: %s", f_path, e)
+        else:
+            app.logger.debug("Arquivo temporário removido: %s", f_path)
+
+def _remover_saidas_antigas():
+    """
+    Apaga de OUTPUT_FOLDER os arquivos mais antigos que IDADE_MAXIMA_SAIDA_SEGUNDOS.
+    Usada no modo X-Sendfile, em que o XLSX não pode ser apagado ao fim da requisição.
+    """
+    limite = time.time() - IDADE_MAXIMA_SAIDA_SEGUNDOS
+    antigos = []
+    with os.scandir(app.config['OUTPUT_FOLDER']) as entradas:
+        for entrada in entradas:
+            try:
+                if entrada.is_file() and entrada.stat().st_mtime < limite:
+                    antigos.append(entrada.path)
+            except FileNotFoundError:
+                continue # Apagado por outra requisição (ou outro worker) depois da listagem
+    _remover_arquivos_temporarios(antigos)
+
+def _nome_planilha(nome_original):
+    """
+    Monta o nome da planilha gerada a partir do nome do PDF enviado. O nome vem do cliente:
+    só o último componente é usado, sem pastas, letra de unidade ou "..", já que ele também
+    é gravado como nome de membro no ZIP.
+
+    :param nome_original: str, nome do PDF enviado.
+    :return: str, nome do XLSX (ex.: "orcamento_extracao.xlsx").
+    """
+    nome_base = nome_original.replace('\\', '/').rpartition('/')[2]
+    return f"{os.path.splitext(nome_base)[0]}_extracao.xlsx"
+
+def _preparar_membro_zip(planilha, nivel_compressao):
+    """
+    Prepara o conteúdo de um XLSX para entrar no ZIP. Roda em threads: zlib libera o GIL
+    durante o CRC e a compressão, então vários membros são preparados ao mesmo tempo.
+
+    :param planilha: BytesIO com o XLSX.
+    :param nivel_compressao: int, 0 para armazenar sem comprimir, 1 a 9 para deflate nesse nível.
+    :return: tuple (dados, crc32, tamanho original, método de compressão, data/hora de modificação).
+    """
+    dados = planilha.getvalue()
+    data_hora = time.localtime()[:6]
+    crc = zlib.crc32(dados)
+    tamanho_original = len(dados)
+    if nivel_compressao:
+        compressor = zlib.compressobj(nivel_compressao, zlib.DEFLATED, -zlib.MAX_WBITS) # deflate puro, como o ZIP exige
+        dados = compressor.compress(dados) + compressor.flush()
+        return dados, crc, tamanho_original, zipfile.ZIP_DEFLATED, data_hora
+    return dados, crc, tamanho_original, zipfile.ZIP_STORED, data_hora
+
+def _gerar_zip_planilhas(planilhas):
+    """
+    Gera o ZIP com as planilhas em partes, uma por planilha, sem gravá-lo em disco.
+    Os membros são comprimidos em paralelo; os cabeçalhos são montados aqui, já com
+    tamanhos e CRC conhecidos.
+
+    :param planilhas: list de tuplas (BytesIO com o XLSX, nome do arquivo dentro do ZIP).
+    :return: gerador de bytes com o conteúdo do ZIP.
+    """
+    # XLSX já é um ZIP comprimido internamente: recomprimir só gasta CPU, então por padrão os membros
+    # são armazenados. PDF2XLSX_ZIP_LEVEL permite trocar por deflate no nível indicado.
+    executor = ThreadPoolExecutor(max_workers=min(len(planilhas), os.cpu_count() or 1))
+    try:
+        futuros = [executor.submit(_preparar_membro_zip, planilha, ZIP_NIVEL_COMPRESSAO)
+                   for planilha, _ in planilhas]
+        diretorio_central = []
+        posicao = 0
+        for (_, nome_arquivo_no_zip), futuro in zip(planilhas, futuros):
+            dados, crc, tamanho_original, metodo, (ano, mes, dia, hora, minuto, segundo) = futuro.result()
+            try:
+                nome = nome_arquivo_no_zip.encode('ascii')
+                flags = 0
+            except UnicodeEncodeError:
+                nome = nome_arquivo_no_zip.encode('utf-8')
+                flags = 0x800 # Nome em UTF-8
+            data_dos = (max(ano, 1980) - 1980) << 9 | mes << 5 | dia
+            hora_dos = hora << 11 | minuto << 5 | segundo // 2
+            campos_comuns = (flags, metodo, hora_dos, data_dos, crc, len(dados), tamanho_original, len(nome))
+            cabecalho_local = struct.pack('<IHHHHHIIIHH', 0x04034b50, 20, *campos_comuns, 0)
+            diretorio_central.append(struct.pack('<IHHHHHHIIIHHHHHII', 0x02014b50, 0x0314, 20, *campos_comuns,
+                                                 0, 0, 0, 0, 0o100644 << 16, posicao) + nome)
+            # Cabeçalho e conteúdo saem separados: concatená-los copiaria a planilha inteira só para
+            # acrescentar algumas dezenas de bytes na frente
+            yield cabecalho_local + nome
+            yield dados
+            posicao += len(cabecalho_local) + len(nome) + len(dados)
+        diretorio = b''.join(diretorio_central)
+        yield diretorio + struct.pack('<IHHHHIIH', 0x06054b50, 0, 0, len(planilhas), len(planilhas),
+                                      len(diretorio), posicao, 0)
+    except Exception as e_zip:
+        app.logger.exception("Erro ao criar ou enviar arquivo ZIP: %s", e_zip)
+        raise
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
 @app.route('/', methods=['GET', 'POST'])
 def rota_upload_arquivo(): 
     """
@@ -544,9 +1040,12 @@ def rota_upload_arquivo():
     GET: Exibe o formulário de upload.
     POST: Processa os arquivos PDF enviados, extrai os dados, e oferece o(s) arquivo(s) Excel para download.
     """
-    g.files_to_remove = [] # Inicializa a lista de arquivos para remoção para esta requisição
+    g.files_to_remove = set() # Arquivos a remover ao fim desta requisição (set evita remoções repetidas)
     
     if request.method == 'POST':
+        if app.config['USE_X_SENDFILE']:
+            _remover_saidas_antigas()
+
         # Pega a lista de arquivos enviados (o input HTML deve ter `multiple`)
         arquivos_enviados = request.files.getlist("file") 
 
@@ -555,94 +1054,155 @@ def rota_upload_arquivo():
             return redirect(request.url)
 
         arquivos_excel_processados_info = [] # Lista para armazenar informações dos Excels gerados
+        arquivos_pendentes = [] # (nome original, conteúdo em bytes) dos PDFs válidos a processar
+        houve_erro = False # Indica se alguma mensagem de erro específica já foi exibida
         
         for arquivo_storage in arquivos_enviados: # Itera sobre cada arquivo enviado
             if arquivo_storage and allowed_file(arquivo_storage.filename):
-                nome_arquivo_original = arquivo_storage.filename
-                id_unico_arquivo = str(uuid.uuid4()) # ID único para este arquivo
-                
-                # Define caminhos para o PDF salvo e o Excel de saída
-                nome_pdf_temporario = f"{id_unico_arquivo}.pdf"
-                caminho_pdf_salvo = os.path.join(app.config['UPLOAD_FOLDER'], nome_pdf_temporario)
-                g.files_to_remove.append(caminho_pdf_salvo) # Marca PDF para remoção
-                
-                try:
-                    arquivo_storage.save(caminho_pdf_salvo) # Salva o PDF enviado
-                    flash(f'Arquivo "{nome_arquivo_original}" recebido. Processando...', 'success')
-
-                    # Instancia e usa o extrator
-                    # debug=True para ver logs no console do Flask, debug_image=False para não salvar imagens no servidor
-                    extrator = ExtratorTabelaPDF(debug=True, debug_image=False, base_path=app.config['UPLOAD_FOLDER']) 
-                    df_extraido = extrator.processar_pdf(caminho_pdf_salvo)
-
-                    if df_extraido is not None and not df_extraido.empty:
-                        nome_excel_temporario = f"{id_unico_arquivo}_extracao.xlsx"
-                        caminho_excel_saida_temp = os.path.join(app.config['OUTPUT_FOLDER'], nome_excel_temporario)
-                        
-                        caminho_excel_gerado = extrator.salvar_resultado_excel(df_extraido, 
-                                                                              caminho_pdf_salvo, 
-                                                                              nome_arquivo_saida_opcional=caminho_excel_saida_temp)
-                        if caminho_excel_gerado and os.path.exists(caminho_excel_gerado):
-                            arquivos_excel_processados_info.append({
-                                "original_name": nome_arquivo_original, # Nome original do PDF
-                                "excel_path": caminho_excel_gerado     # Caminho para o XLSX gerado
-                            })
-                            g.files_to_remove.append(caminho_excel_gerado) # Marca XLSX para remoção
-                        else:
-                            flash(f'Falha ao gerar o arquivo Excel para "{nome_arquivo_original}".', 'error')
-                    else:
-                        flash(f'Não foram extraídos dados do PDF "{nome_arquivo_original}" ou o resultado estava vazio.', 'error')
-                except Exception as e_proc:
-                    print(f"Erro ao processar o arquivo {nome_arquivo_original}: {e_proc}")
-                    flash(f'Erro ao processar o arquivo "{nome_arquivo_original}". Verifique os logs do servidor.', 'error')
+                # Lê o PDF enviado direto para a memória: o pdfplumber o abre de um BytesIO,
+                # sem gravar uma cópia em disco só para lê-la de volta
+                conteudo_pdf = arquivo_storage.stream.getvalue()
+                if not parece_pdf(conteudo_pdf):
+                    flash(f'O arquivo "{arquivo_storage.filename}" não é um PDF válido.', 'error')
+                    houve_erro = True
+                    continue
+                arquivos_pendentes.append((arquivo_storage.filename, conteudo_pdf))
+                flash(f'Arquivo "{arquivo_storage.filename}" recebido. Processando...', 'success')
             elif arquivo_storage.filename: # Se tem nome mas não é um PDF permitido
                 flash(f'Tipo de arquivo não permitido para "{arquivo_storage.filename}". Apenas PDFs são aceitos.', 'error')
+                houve_erro = True
+
+        # PDFs com o mesmo conteúdo de um envio anterior são atendidos pelo cache, sem nova extração.
+        # Os demais recebem seu caminho de saída já aqui, para que o XLSX seja marcado para remoção
+        # mesmo que o processamento falhe no meio do caminho.
+        resultados = [None] * len(arquivos_pendentes)
+        chaves_conteudo = []
+        tarefas = {} # índice em resultados -> argumentos de _processar_um_pdf
+        for indice, (nome_arquivo_original, conteudo) in enumerate(arquivos_pendentes):
+            chave_conteudo = hashlib.sha256(conteudo).hexdigest()
+            chaves_conteudo.append(chave_conteudo)
+            planilha_em_cache = _planilha_em_cache(chave_conteudo)
+            if planilha_em_cache is not None:
+                resultados[indice] = {"original_name": nome_arquivo_original, "excel_path": BytesIO(planilha_em_cache)}
+                continue
+            if len(arquivos_pendentes) == 1 and not app.config['USE_X_SENDFILE']:
+                # Um único PDF: o XLSX é gerado em memória e enviado de lá, sem gravar e reler um arquivo
+                tarefas[indice] = (conteudo, nome_arquivo_original, BytesIO())
+                continue
+            id_unico_arquivo = secrets.token_hex(12) # ID único para este arquivo (96 bits aleatórios)
+            caminho_excel_saida_temp = os.path.join(app.config['OUTPUT_FOLDER'], f"{id_unico_arquivo}_extracao.xlsx")
+            g.files_to_remove.add(caminho_excel_saida_temp) # Marca XLSX para remoção
+            tarefas[indice] = (conteudo, nome_arquivo_original, caminho_excel_saida_temp)
+
+        # A extração é CPU-bound e segura o GIL (pdfminer), então vários PDFs são processados em
+        # processos separados. Um único PDF é processado aqui mesmo, sem o custo de usar o pool.
+        if len(tarefas) == 1:
+            [(indice, tarefa)] = tarefas.items()
+            try:
+                resultados[indice] = _processar_um_pdf(*tarefa)
+            except Exception as e_proc:
+                resultados[indice] = _resultado_com_erro(tarefa[1], e_proc)
+        elif tarefas:
+            executor = _obter_pool_extracao()
+            futuros = {executor.submit(_processar_um_pdf, *tarefa): indice for indice, tarefa in tarefas.items()}
+            for futuro in as_completed(futuros):
+                indice = futuros[futuro]
+                try:
+                    resultados[indice] = futuro.result()
+                except Exception as e_proc:
+                    if isinstance(e_proc, BrokenProcessPool):
+                        _descartar_pool_extracao(executor)
+                    resultados[indice] = _resultado_com_erro(tarefas[indice][1], e_proc)
+
+        # Cada XLSX gravado em disco é lido uma única vez: os bytes vão para o cache e seguem em
+        # memória até a resposta, e o arquivo é apagado logo em seguida. Com X-Sendfile o arquivo
+        # fica em disco até o fim da requisição, caso seja a única planilha a enviar.
+        for indice in tarefas:
+            planilha = resultados[indice]["excel_path"]
+            if not planilha:
+                continue
+            if isinstance(planilha, str):
+                with open(planilha, 'rb') as f:
+                    dados = f.read()
+                resultados[indice]["excel_path"] = BytesIO(dados)
+                if app.config['USE_X_SENDFILE']:
+                    resultados[indice]["arquivo_em_disco"] = planilha
+                else:
+                    g.files_to_remove.discard(planilha)
+                    _remover_arquivos_temporarios((planilha,))
+            else:
+                dados = planilha.getvalue()
+            _guardar_planilha_em_cache(chaves_conteudo[indice], dados)
+
+        # Os resultados seguem a ordem de envio, para que o ZIP liste as planilhas nessa ordem
+        resumo_log = [] # Uma única linha de log por requisição, em vez de uma por PDF
+        for resultado in resultados:
+            if resultado["excel_path"]:
+                arquivos_excel_processados_info.append(resultado)
+                resumo_log.append(f'{resultado["original_name"]}: ok')
+            else:
+                flash(resultado["erro"], 'error')
+                houve_erro = True
+                resumo_log.append(f'{resultado["original_name"]}: falha')
+        if resumo_log:
+            app.logger.info("%d PDF(s) processado(s): %s", len(resumo_log), "; ".join(resumo_log))
         
         # Após processar todos os arquivos enviados
         if not arquivos_excel_processados_info: # Se nenhum arquivo foi processado com sucesso
-            if not get_flashed_messages(category_filter=['error']): # Evita duplicar msg se já houve erro específico
+            if not houve_erro: # Evita duplicar msg se já houve erro específico
                  flash('Nenhum arquivo PDF foi processado com sucesso ou nenhum dado foi extraído.', 'error')
             return redirect(request.url)
 
         if len(arquivos_excel_processados_info) == 1:
             # Se apenas um Excel foi gerado, envia diretamente
             info_arquivo_unico = arquivos_excel_processados_info[0]
-            nome_original_sem_ext = os.path.splitext(info_arquivo_unico["original_name"])[0]
-            nome_download_excel = f"{nome_original_sem_ext}_extracao.xlsx"
+            nome_download_excel = _nome_planilha(info_arquivo_unico["original_name"])
+            planilha_unica = info_arquivo_unico["excel_path"]
+            if "arquivo_em_disco" in info_arquivo_unico:
+                # O servidor web lê o arquivo depois que a resposta sai daqui
+                planilha_unica = info_arquivo_unico["arquivo_em_disco"]
+                g.files_to_remove.discard(planilha_unica)
             try:
-                return send_file(info_arquivo_unico["excel_path"], as_attachment=True, download_name=nome_download_excel)
+                return send_file(planilha_unica, as_attachment=True, download_name=nome_download_excel)
             except Exception as e_send_single:
-                print(f"Erro ao enviar arquivo Excel único: {e_send_single}")
+                app.logger.exception("Erro ao enviar arquivo Excel único: %s", e_send_single)
                 flash('Erro ao preparar arquivo Excel para download.', 'error')
                 return redirect(request.url)
         else:
-            # Se múltiplos Excels foram gerados, cria um arquivo ZIP
-            id_zip_unico = str(uuid.uuid4())
-            nome_arquivo_zip = f"extracao_multipla_{id_zip_unico}.zip"
-            caminho_zip_saida = os.path.join(app.config['OUTPUT_FOLDER'], nome_arquivo_zip)
-            g.files_to_remove.append(caminho_zip_saida) # Marca ZIP para remoção
+            # Se múltiplos Excels foram gerados, envia um ZIP montado enquanto é transmitido,
+            # a partir das planilhas já em memória
+            planilhas_zip = []
+            for info in arquivos_excel_processados_info:
+                planilhas_zip.append((info["excel_path"], _nome_planilha(info["original_name"])))
+            return Response(_gerar_zip_planilhas(planilhas_zip), mimetype='application/zip',
+                            headers={'Content-Disposition': 'attachment; filename=planilhas_extraidas.zip'})
 
-            try:
-                with zipfile.ZipFile(caminho_zip_saida, 'w', zipfile.ZIP_DEFLATED) as zipf:
-                    for info in arquivos_excel_processados_info:
-                        nome_original_sem_ext = os.path.splitext(info["original_name"])[0]
-                        # Nome do arquivo dentro do ZIP
-                        nome_arquivo_no_zip = f"{nome_original_sem_ext}_extracao.xlsx" 
-                        zipf.write(info["excel_path"], arcname=nome_arquivo_no_zip)
-                
-                return send_file(caminho_zip_saida, as_attachment=True, download_name="planilhas_extraidas.zip")
-            except Exception as e_zip:
-                print(f"Erro ao criar ou enviar arquivo ZIP: {e_zip}")
-                flash('Erro ao criar arquivo ZIP para download.', 'error')
-                return redirect(request.url)
-
-    # Para requisições GET, apenas renderiza o formulário
-    return render_template_string(HTML_FORM)
+    # Para requisições GET, serve o formulário pronto; só renderiza quando há mensagens flash a exibir
+    if not session.get('_flashes'):
+        for codificacao, corpo in FORM_HTML_COMPRIMIDO:
+            if request.accept_encodings[codificacao]:
+                resposta = Response(corpo, mimetype='text/html', headers={'Content-Encoding': codificacao})
+                resposta.set_etag(f"{FORM_ETAG}-{codificacao}") # Cada codificação é uma representação distinta
+                break
+        else:
+            resposta = Response(FORM_HTML_BYTES, mimetype='text/html')
+            resposta.set_etag(FORM_ETAG)
+        resposta.vary.add('Accept-Encoding')
+        # no-cache (revalidar sempre) em vez de max-age: o redirect após um POST volta a esta mesma URL
+        # e uma cópia ainda "fresca" no navegador esconderia as mensagens flash do processamento
+        resposta.cache_control.no_cache = True
+        return resposta.make_conditional(request)
+    return FORM_TEMPLATE.render()
 
-# Bloco para executar a aplicação Flask
+# Bloco para executar a aplicação Flask com o servidor de desenvolvimento.
+# Em produção, use um servidor WSGI com o wsgi.py (ver README): o servidor de desenvolvimento
+# atende mal a envios simultâneos e roda com debug=True.
 if __name__ == '__main__':
-    print(f"Pasta de Uploads Temporários: {os.path.abspath(UPLOAD_FOLDER)}")
-    print(f"Pasta de Saídas Temporárias: {os.path.abspath(OUTPUT_FOLDER)}")
-    # debug=True é útil para desenvolvimento, mas desabilite em produção.
+    if not os.environ.get('FLASK_DEV'):
+        raise SystemExit("Servidor de desenvolvimento desativado. Defina FLASK_DEV=1 para usá-lo, "
+                         "ou rode em produção com: WEB_CONCURRENCY=2 gunicorn --preload --timeout 120 wsgi:application")
+    app.logger.setLevel(logging.DEBUG) # Mostra também as remoções de arquivos temporários
+    app.logger.info("Pasta de Uploads Temporários: %s", os.path.abspath(UPLOAD_FOLDER))
+    app.logger.info("Pasta de Saídas Temporárias: %s", os.path.abspath(OUTPUT_FOLDER))
     # host='0.0.0.0' torna o servidor acessível na sua rede local (use o IP da sua máquina).
     app.run(host='0.0.0.0', port=5000, debug=True)
@@ -0,0 +1,46 @@
+"""
+Verifica o ZIP montado à mão por _gerar_zip_planilhas: o arquivo precisa abrir com o módulo
+zipfile, com nomes não ASCII e com os membros armazenados ou comprimidos.
+
+    python -m unittest discover tests
+"""
+import os
+import sys
+import unittest
+import zipfile
+from io import BytesIO
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app
+
+
+class TestZipPlanilhas(unittest.TestCase):
+    # Nomes como vêm do cliente: com pastas absolutas, "..", separadores do Windows e acentos
+    PLANILHAS = {
+        app._nome_planilha('/abs/dir/orcamento.pdf'): b'PK\x03\x04' + os.urandom(2048),
+        app._nome_planilha('..\\..\\peças_ação.pdf'): b'linha repetida\n' * 500,
+    }
+
+    def _abrir_zip(self, nivel_compressao):
+        planilhas = [(BytesIO(conteudo), nome) for nome, conteudo in self.PLANILHAS.items()]
+        with mock.patch.object(app, 'ZIP_NIVEL_COMPRESSAO', nivel_compressao):
+            dados_zip = b''.join(app._gerar_zip_planilhas(planilhas))
+        return zipfile.ZipFile(BytesIO(dados_zip))
+
+    def test_nomes_sem_pastas(self):
+        self.assertEqual(list(self.PLANILHAS), ['orcamento_extracao.xlsx', 'peças_ação_extracao.xlsx'])
+
+    def test_zip_legivel(self):
+        for nivel_compressao, metodo in ((0, zipfile.ZIP_STORED), (6, zipfile.ZIP_DEFLATED)):
+            with self.subTest(nivel_compressao=nivel_compressao), self._abrir_zip(nivel_compressao) as arquivo_zip:
+                self.assertIsNone(arquivo_zip.testzip())
+                self.assertEqual(arquivo_zip.namelist(), list(self.PLANILHAS))
+                for membro in arquivo_zip.infolist():
+                    self.assertEqual(membro.compress_type, metodo)
+                    self.assertEqual(arquivo_zip.read(membro), self.PLANILHAS[membro.filename])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,20 @@
+"""
+Ponto de entrada WSGI para servidores de produção, por exemplo:
+
+    WEB_CONCURRENCY=2 gunicorn --preload --timeout 120 wsgi:application
+
+O gunicorn usa WEB_CONCURRENCY como número de workers, e o app.py divide os núcleos entre
+eles ao dimensionar o pool de extração de cada worker.
+
+Com --preload este módulo é carregado uma vez no processo mestre, antes da criação dos
+workers. O app.py só importa pandas e pdfplumber quando um PDF é processado, então eles são
+importados aqui para que também fiquem no mestre e sejam compartilhados com os workers.
+Pelo mesmo motivo, a função compilada pelo Numba é carregada aqui.
+"""
+import pandas # noqa: F401
+import pdfplumber # noqa: F401
+
+import app as _modulo_app
+from app import app as application
+
+_modulo_app._obter_intervalos_fusao_titulos()